@@ -3,13 +3,21 @@ from discord.ext import commands
 from discord import app_commands
 import os
 from dotenv import load_dotenv
+
+# Load .env before importing modules that read settings from the environment
+load_dotenv()
+
 from models import data_manager, create_user, create_config, create_daily_problem
-from leetcode import get_daily_problem, get_user_solved_count
+from leetcode import get_daily_problem, get_user_solved_count, get_users_solved_counts, get_submission_calendars, get_cached_problem_metadata, prefetch_problem_metadata
 from apscheduler.schedulers.asyncio import AsyncIOScheduler
 from apscheduler.triggers.cron import CronTrigger
 import datetime
+import asyncio
+import io
+import csv
+import json
+from tracing import traced, set_span_attributes, profiler
 
-load_dotenv()
 TOKEN = os.getenv('DISCORD_TOKEN')
 
 intents = discord.Intents.default()
@@ -18,6 +26,18 @@ bot = commands.Bot(command_prefix='!', intents=intents)
 
 scheduler = AsyncIOScheduler()
 
+def add_problem_details(embed: discord.Embed, slug: str):
+    """Add difficulty, acceptance rate and topics from the metadata cache (no network)"""
+    metadata = get_cached_problem_metadata(slug)
+    if not metadata:
+        return
+    if metadata.get('difficulty'):
+        embed.add_field(name="Difficulty", value=metadata['difficulty'], inline=True)
+    if metadata.get('ac_rate') is not None:
+        embed.add_field(name="Acceptance", value=f"{metadata['ac_rate']}%", inline=True)
+    if metadata.get('topic_tags'):
+        embed.add_field(name="Topics", value=", ".join(metadata['topic_tags'][:8]), inline=False)
+
 @bot.event
 async def on_ready():
     print(f'Logged in as {bot.user}')
@@ -54,6 +74,24 @@ async def on_ready():
     )
     print('Scheduled automatic user progress checking every 4 hours')
     
+    # Rebuild streaks from submission calendars once the UTC day is over
+    reconcile_trigger = CronTrigger(hour=0, minute=30, timezone='UTC')
+    scheduler.add_job(
+        reconcile_user_streaks,
+        reconcile_trigger,
+        id='streak_reconciliation'
+    )
+    print('Scheduled nightly streak reconciliation at 00:30 UTC')
+    
+    # Move history older than the retention window out of the data file
+    compaction_trigger = CronTrigger(hour=1, minute=0, timezone='UTC')
+    scheduler.add_job(
+        data_manager.compact,
+        compaction_trigger,
+        id='data_compaction'
+    )
+    print(f'Scheduled nightly data compaction at 01:00 UTC (keeping {data_manager.retention_days} days)')
+    
     # Print current jobs for debugging
     jobs = scheduler.get_jobs()
     print(f'Total scheduled jobs: {len(jobs)}')
@@ -67,20 +105,29 @@ async def on_ready():
     scheduler.start()
     print('Daily problem scheduler started')
 
+def solved_today(user: dict) -> bool:
+    """Whether the user's last solve was today (UTC)"""
+    last_solve_date = user.get('last_solve_date')
+    if not last_solve_date:
+        return False
+    return datetime.datetime.fromisoformat(last_solve_date).date() == datetime.datetime.now(datetime.UTC).date()
+
+@traced('job.post_daily_problem')
 async def post_daily_problem_for_guild(guild_id: str, channel_id: str):
+    set_span_attributes(guild=guild_id)
     config = data_manager.get_config(guild_id)
     if not config:
         print(f"No config found for guild {guild_id}")
         return
         
     difficulty = config.get('difficulty', 'random')
-    problem = get_daily_problem(difficulty)
+    problem = await asyncio.to_thread(get_daily_problem, difficulty)
     if problem:
         # Check if already posted today
         today = datetime.datetime.now(datetime.UTC).date().isoformat()
         existing = data_manager.get_daily_problem(today)
         if not existing:
-            daily_prob = create_daily_problem(problem['id'], problem['title'])
+            daily_prob = create_daily_problem(problem['id'], problem['title'], problem['slug'])
             data_manager.save_daily_problem(today, daily_prob)
             
             # Get users who solved yesterday's problem for pinging
@@ -103,10 +150,14 @@ async def post_daily_problem_for_guild(guild_id: str, channel_id: str):
                     "random": "🎲"
                 }.get(difficulty, "🎲")
                 
+                # Fill in topic tags (the difficulty catalog doesn't have them) before building the embed
+                await asyncio.to_thread(prefetch_problem_metadata, [problem['slug']])
+                
                 embed = discord.Embed(
                     title=f"Daily LeetCode Challenge {difficulty_emoji}",
                     description=f"**{problem['title']}**\nSolve it here: https://leetcode.com/problems/{problem['slug']}/"
                 )
+                add_problem_details(embed, problem['slug'])
                 await channel.send(content=ping_message, embed=embed)
                 print(f'Posted {difficulty} problem to guild {guild_id}')
         else:
@@ -127,6 +178,7 @@ async def post_daily_problem_for_guild(guild_id: str, channel_id: str):
     app_commands.Choice(name="Medium", value="medium"),
     app_commands.Choice(name="Hard", value="hard")
 ])
+@traced('command.setup_channel', command='setup_channel')
 async def setup_channel(interaction: discord.Interaction, channel: discord.TextChannel, hour: int = 9, minute: int = 0, difficulty: str = "random"):
     if not interaction.user.guild_permissions.administrator:
         await interaction.response.send_message("You need administrator permissions to set the channel.", ephemeral=True)
@@ -183,19 +235,153 @@ async def setup_channel(interaction: discord.Interaction, channel: discord.TextC
 
 @bot.tree.command(name="setup_username", description="Link your LeetCode username")
 @app_commands.describe(username="Your LeetCode username")
+@traced('command.setup_username', command='setup_username')
 async def setup_username(interaction: discord.Interaction, username: str):
-    user = data_manager.get_user(str(interaction.user.id))
     current_count = get_user_solved_count(username)
-    if user:
-        user['leetcode_username'] = username
-        user['solved_count'] = current_count
-        data_manager.save_user(str(interaction.user.id), user)
-    else:
-        user = create_user(str(interaction.user.id), username, current_count)
-        data_manager.save_user(str(interaction.user.id), user)
+    
+    def link_username(record):
+        if record:
+            record['leetcode_username'] = username
+            record['solved_count'] = current_count
+            return record
+        return create_user(str(interaction.user.id), username, current_count)
+    
+    data_manager.update_user(str(interaction.user.id), link_username)
     await interaction.response.send_message(f"Linked your LeetCode username: {username}", ephemeral=True)
 
+def parse_username_mapping(filename: str, content: str):
+    """Parse a CSV or JSON upload into (discord_id, leetcode_username) rows.
+
+    Accepts a JSON object ``{"discord_id": "username"}``, a JSON list of
+    ``{"discord_id": ..., "leetcode_username": ...}`` objects, or a CSV with
+    those two columns (header optional). Returns (rows, errors).
+    """
+    rows = []
+    errors = []
+    if filename.lower().endswith('.json'):
+        data = json.loads(content)
+        if isinstance(data, dict):
+            rows = [(str(k), v) for k, v in data.items()]
+        elif isinstance(data, list):
+            for i, item in enumerate(data, 1):
+                if isinstance(item, dict):
+                    rows.append((str(item.get('discord_id', '')), item.get('leetcode_username')))
+                else:
+                    errors.append(f"entry {i}: expected an object")
+        else:
+            raise ValueError("JSON must be an object or a list")
+    else:
+        for line_no, row in enumerate(csv.reader(io.StringIO(content)), 1):
+            if not row or not any(cell.strip() for cell in row):
+                continue
+            if line_no == 1 and not row[0].strip().isdigit():
+                continue  # header
+            if len(row) < 2:
+                errors.append(f"line {line_no}: expected discord_id,leetcode_username")
+                continue
+            rows.append((row[0], row[1]))
+
+    cleaned = []
+    for discord_id, username in rows:
+        discord_id = discord_id.strip()
+        username = username.strip() if isinstance(username, str) else ''
+        if not discord_id.isdigit():
+            errors.append(f"{discord_id or '(blank)'}: invalid Discord ID")
+        elif not username:
+            errors.append(f"{discord_id}: missing LeetCode username")
+        else:
+            cleaned.append((discord_id, username))
+    return cleaned, errors
+
+@bot.tree.command(name="bulk_import", description="Link many LeetCode usernames from a CSV/JSON file (admin only)")
+@app_commands.describe(file="CSV or JSON mapping Discord IDs to LeetCode usernames")
+@traced('command.bulk_import', command='bulk_import')
+async def bulk_import(interaction: discord.Interaction, file: discord.Attachment):
+    if not interaction.user.guild_permissions.administrator:
+        await interaction.response.send_message("You need administrator permissions to import users.", ephemeral=True)
+        return
+
+    await interaction.response.defer(ephemeral=True, thinking=True)
+
+    try:
+        content = (await file.read()).decode('utf-8-sig')
+        rows, errors = parse_username_mapping(file.filename, content)
+    except (UnicodeDecodeError, ValueError) as e:
+        await interaction.followup.send(f"Could not parse {file.filename}: {e}", ephemeral=True)
+        return
+
+    # Duplicates within the file and against usernames already linked to someone else
+    linked = data_manager.get_linked_usernames()
+    seen_ids = set()
+    seen_usernames = {}
+    duplicates = []
+    candidates = []
+    for discord_id, username in rows:
+        key = username.lower()
+        if discord_id in seen_ids:
+            duplicates.append(f"{discord_id}: Discord ID listed more than once")
+        elif key in seen_usernames:
+            duplicates.append(f"{discord_id}: {username} is also listed for {seen_usernames[key]}")
+        elif linked.get(key, discord_id) != discord_id:
+            duplicates.append(f"{discord_id}: {username} is already linked to {linked[key]}")
+        else:
+            seen_ids.add(discord_id)
+            seen_usernames[key] = discord_id
+            candidates.append((discord_id, username))
+
+    # Validate and baseline everyone off the event loop
+    counts = await asyncio.to_thread(get_users_solved_counts, [username for _, username in candidates])
+
+    invalid = []
+    updates = {}
+    for discord_id, username in candidates:
+        if username not in counts:
+            invalid.append(f"{discord_id}: could not reach LeetCode to check {username}")
+        elif counts[username] is None:
+            invalid.append(f"{discord_id}: {username} is not a LeetCode user")
+        else:
+            updates[discord_id] = (username, counts[username])
+
+    linked_now = None
+
+    def link_username(discord_id, username, solved_count):
+        # Merged into the latest record, so streaks changed during validation are kept
+        def apply(record):
+            # Checked again under the write lock: /setup_username may have claimed it meanwhile
+            nonlocal linked_now
+            if linked_now is None:
+                linked_now = data_manager.get_linked_usernames()
+            owner = linked_now.get(username.lower(), discord_id)
+            if owner != discord_id:
+                duplicates.append(f"{discord_id}: {username} is already linked to {owner}")
+                return None
+            if record:
+                record['leetcode_username'] = username
+                record['solved_count'] = solved_count
+                return record
+            return create_user(discord_id, username, solved_count)
+        return apply
+
+    imported = {}
+    if updates:
+        imported = data_manager.update_users({
+            discord_id: link_username(discord_id, username, solved_count)
+            for discord_id, (username, solved_count) in updates.items()
+        })
+
+    summary = (
+        f"Imported {len(imported)} user(s) from {file.filename}.\n"
+        f"Invalid: {len(errors) + len(invalid)} | Duplicates: {len(duplicates)}"
+    )
+    problems = errors + invalid + duplicates
+    if problems:
+        report = discord.File(io.BytesIO('\n'.join(problems).encode()), filename="import_report.txt")
+        await interaction.followup.send(summary, file=report, ephemeral=True)
+    else:
+        await interaction.followup.send(summary, ephemeral=True)
+
 @bot.tree.command(name="status", description="Check if you've solved today's problem")
+@traced('command.status', command='status')
 async def status(interaction: discord.Interaction):
     user = data_manager.get_user(str(interaction.user.id))
     if not user:
@@ -220,12 +406,19 @@ async def status(interaction: discord.Interaction):
     
     # Try to detect solve automatically
     current_count = get_user_solved_count(user['leetcode_username'])
-    if current_count > user['solved_count']:
-        # Update user's solved count and streak
-        user['solved_count'] = current_count
-        user['streak'] += 1
-        user['last_solve_date'] = datetime.datetime.now(datetime.UTC).isoformat()
-        data_manager.save_user(str(interaction.user.id), user)
+    
+    def record_solve(record):
+        # Re-check against the latest record in case something else updated it meanwhile
+        if not record or solved_today(record) or current_count <= record['solved_count']:
+            return None
+        record['solved_count'] = current_count
+        record['streak'] += 1
+        record['last_solve_date'] = datetime.datetime.now(datetime.UTC).isoformat()
+        return record
+    
+    updated = data_manager.update_user(str(interaction.user.id), record_solve)
+    if updated:
+        user = updated
         
         # Announce the solve if there's a configured channel
         config = data_manager.get_config(str(interaction.guild.id))
@@ -237,6 +430,7 @@ async def status(interaction: discord.Interaction):
                     description=f"**{interaction.user.mention}** solved today's problem!\n**{problem['title']}**\n\nStreak: {user['streak']} 🔥",
                     color=0x00ff00
                 )
+                add_problem_details(embed, problem.get('slug'))
                 await channel.send(embed=embed)
         
         await interaction.response.send_message(f"You've solved today's problem! Streak: {user['streak']}", ephemeral=True)
@@ -244,12 +438,14 @@ async def status(interaction: discord.Interaction):
         # Show current status with option to mark as solved
         embed = discord.Embed(title="Daily Problem Status", color=0xffa500)
         embed.add_field(name="Problem", value=problem['title'], inline=False)
+        add_problem_details(embed, problem.get('slug'))
         embed.add_field(name="Your Streak", value=str(user['streak']), inline=True)
         embed.add_field(name="Status", value="Not solved yet", inline=True)
         embed.set_footer(text="Solves are automatically checked every 4 hours. Use /mark_solved if needed.")
         await interaction.response.send_message(embed=embed, ephemeral=True)
 
 @bot.tree.command(name="mark_solved", description="Manually mark today's problem as solved")
+@traced('command.mark_solved', command='mark_solved')
 async def mark_solved(interaction: discord.Interaction):
     user = data_manager.get_user(str(interaction.user.id))
     if not user:
@@ -273,9 +469,19 @@ async def mark_solved(interaction: discord.Interaction):
             return
     
     # Mark as solved and update streak
-    user['streak'] += 1
-    user['last_solve_date'] = datetime.datetime.now(datetime.UTC).isoformat()
-    data_manager.save_user(str(interaction.user.id), user)
+    def record_solve(record):
+        if not record or solved_today(record):
+            return None
+        record['streak'] += 1
+        record['last_solve_date'] = datetime.datetime.now(datetime.UTC).isoformat()
+        return record
+    
+    updated = data_manager.update_user(str(interaction.user.id), record_solve)
+    if not updated:
+        user = data_manager.get_user(str(interaction.user.id))
+        await interaction.response.send_message(f"You've already marked today's problem as solved! Streak: {user['streak']}", ephemeral=True)
+        return
+    user = updated
     
     # Announce the solve if there's a configured channel
     config = data_manager.get_config(str(interaction.guild.id))
@@ -290,11 +496,13 @@ async def mark_solved(interaction: discord.Interaction):
                     description=f"**{interaction.user.mention}** solved today's problem!\n**{problem['title']}**\n\nStreak: {user['streak']} 🔥",
                     color=0x00ff00
                 )
+                add_problem_details(embed, problem.get('slug'))
                 await channel.send(embed=embed)
     
     await interaction.response.send_message(f"Marked today's problem as solved! Streak: {user['streak']}", ephemeral=True)
 
 @bot.tree.command(name="view_config", description="View the current daily post configuration")
+@traced('command.view_config', command='view_config')
 async def view_config(interaction: discord.Interaction):
     config = data_manager.get_config(str(interaction.guild.id))
     
@@ -318,6 +526,7 @@ async def view_config(interaction: discord.Interaction):
     await interaction.response.send_message(embed=embed, ephemeral=True)
 
 @bot.tree.command(name="post_now", description="Post the daily LeetCode problem immediately (admin only)")
+@traced('command.post_now', command='post_now')
 async def post_now(interaction: discord.Interaction):
     if not interaction.user.guild_permissions.administrator:
         await interaction.response.send_message("You need administrator permissions to post immediately.", ephemeral=True)
@@ -328,24 +537,30 @@ async def post_now(interaction: discord.Interaction):
         await interaction.response.send_message("No configuration found. Use `/setup_channel` first.", ephemeral=True)
         return
     
+    # Fetching the problem and its metadata can take longer than Discord's reply window
+    await interaction.response.defer(ephemeral=True, thinking=True)
+    
     # Get the daily problem with configured difficulty
     difficulty = config.get('difficulty', 'random')
-    problem = get_daily_problem(difficulty)
+    problem = await asyncio.to_thread(get_daily_problem, difficulty)
     if not problem:
-        await interaction.response.send_message("Failed to fetch daily problem. Try again later.", ephemeral=True)
+        await interaction.followup.send("Failed to fetch daily problem. Try again later.", ephemeral=True)
         return
     
     # Check if already posted today
     today = datetime.datetime.now(datetime.UTC).date().isoformat()
     existing = data_manager.get_daily_problem(today)
     if existing:
-        await interaction.response.send_message("Today's problem has already been posted.", ephemeral=True)
+        await interaction.followup.send("Today's problem has already been posted.", ephemeral=True)
         return
     
     # Save the problem
-    daily_prob = create_daily_problem(problem['id'], problem['title'])
+    daily_prob = create_daily_problem(problem['id'], problem['title'], problem['slug'])
     data_manager.save_daily_problem(today, daily_prob)
     
+    # Fill in topic tags (the difficulty catalog doesn't have them) before building the embed
+    await asyncio.to_thread(prefetch_problem_metadata, [problem['slug']])
+    
     # Post to the configured channel
     channel = bot.get_channel(int(config['channel_id']))
     if channel:
@@ -360,12 +575,14 @@ async def post_now(interaction: discord.Interaction):
             title=f"Daily LeetCode Challenge {difficulty_emoji}",
             description=f"**{problem['title']}**\nSolve it here: https://leetcode.com/problems/{problem['slug']}/"
         )
+        add_problem_details(embed, problem['slug'])
         await channel.send(embed=embed)
-        await interaction.response.send_message(f"Posted {difficulty} problem to {channel.mention}!", ephemeral=True)
+        await interaction.followup.send(f"Posted {difficulty} problem to {channel.mention}!", ephemeral=True)
     else:
-        await interaction.response.send_message("Could not find the configured channel.", ephemeral=True)
+        await interaction.followup.send("Could not find the configured channel.", ephemeral=True)
 
 @bot.tree.command(name="today_solvers", description="Show who has solved today's problem")
+@traced('command.today_solvers', command='today_solvers')
 async def today_solvers(interaction: discord.Interaction):
     today = datetime.datetime.now(datetime.UTC).date().isoformat()
     problem = data_manager.get_daily_problem(today)
@@ -387,12 +604,13 @@ async def today_solvers(interaction: discord.Interaction):
         embed.add_field(name="Solvers", value="No one has solved today's problem yet! 🧩", inline=False)
     
     # Add some stats
-    total_users = len(data_manager.data['users'])
+    total_users = data_manager.get_user_count()
     embed.set_footer(text=f"Total registered users: {total_users}")
     
     await interaction.response.send_message(embed=embed)
 
 @bot.tree.command(name="leaderboard", description="View the top streaks and active solvers")
+@traced('command.leaderboard', command='leaderboard')
 async def leaderboard(interaction: discord.Interaction):
     embed = discord.Embed(title="🏆 LeetCode Leaderboard", color=0xffd700)
     
@@ -425,6 +643,7 @@ async def leaderboard(interaction: discord.Interaction):
     await interaction.response.send_message(embed=embed)
 
 @bot.tree.command(name="test_post", description="Test the daily posting (admin only)")
+@traced('command.test_post', command='test_post')
 async def test_post(interaction: discord.Interaction):
     if not interaction.user.guild_permissions.administrator:
         await interaction.response.send_message("You need administrator permissions to test posting.", ephemeral=True)
@@ -435,13 +654,18 @@ async def test_post(interaction: discord.Interaction):
         await interaction.response.send_message("No configuration found. Use `/setup_channel` first.", ephemeral=True)
         return
     
+    # Fetching the problem and its metadata can take longer than Discord's reply window
+    await interaction.response.defer(ephemeral=True, thinking=True)
+    
     # Get the daily problem with configured difficulty
     difficulty = config.get('difficulty', 'random')
-    problem = get_daily_problem(difficulty)
+    problem = await asyncio.to_thread(get_daily_problem, difficulty)
     if not problem:
-        await interaction.response.send_message("Failed to fetch daily problem. Try again later.", ephemeral=True)
+        await interaction.followup.send("Failed to fetch daily problem. Try again later.", ephemeral=True)
         return
     
+    await asyncio.to_thread(prefetch_problem_metadata, [problem['slug']])
+    
     # Post to the configured channel
     channel = bot.get_channel(int(config['channel_id']))
     if channel:
@@ -457,60 +681,171 @@ async def test_post(interaction: discord.Interaction):
             description=f"**{problem['title']}**\nSolve it here: https://leetcode.com/problems/{problem['slug']}/",
             color=0xffa500
         )
+        add_problem_details(embed, problem['slug'])
         await channel.send(embed=embed)
-        await interaction.response.send_message(f"Test post sent to {channel.mention}!", ephemeral=True)
+        await interaction.followup.send(f"Test post sent to {channel.mention}!", ephemeral=True)
     else:
-        await interaction.response.send_message("Could not find the configured channel.", ephemeral=True)
+        await interaction.followup.send("Could not find the configured channel.", ephemeral=True)
+
+@bot.tree.command(name="profile", description="Run the sampling profiler for a few seconds (admin only)")
+@app_commands.describe(seconds="How long to sample for (1-60, default: 10)")
+async def profile(interaction: discord.Interaction, seconds: int = 10):
+    if not interaction.user.guild_permissions.administrator:
+        await interaction.response.send_message("You need administrator permissions to run the profiler.", ephemeral=True)
+        return
+
+    if not (1 <= seconds <= 60):
+        await interaction.response.send_message("Seconds must be between 1 and 60.", ephemeral=True)
+        return
 
+    if profiler.running:
+        await interaction.response.send_message("The profiler is already running.", ephemeral=True)
+        return
+
+    await interaction.response.defer(ephemeral=True, thinking=True)
+    profiler.start()
+    try:
+        await asyncio.sleep(seconds)
+    finally:
+        folded = profiler.stop()
+
+    if not folded:
+        await interaction.followup.send("No samples were collected.", ephemeral=True)
+        return
+
+    # Folded stacks can be fed straight into flamegraph.pl or speedscope
+    dump = discord.File(io.BytesIO(folded.encode()), filename=f"profile_{seconds}s.folded")
+    await interaction.followup.send(
+        f"Collected {profiler.sample_count} samples over {seconds}s.",
+        file=dump,
+        ephemeral=True
+    )
+
+@traced('job.user_progress_check')
 def check_and_update_user_progress():
     """Check all users' LeetCode progress and update if they've solved new problems"""
     print("Checking user progress...")
     users = data_manager.get_all_users()
-    updated_count = 0
-    
+    set_span_attributes(users=len(users))
+
+    new_counts = {}
     for user_id, user_data in users.items():
         if 'leetcode_username' in user_data:
-            username = user_data['leetcode_username']
-            current_solved = get_user_solved_count(username)
-            previous_solved = user_data.get('solved_count', 0)
-            
-            if current_solved > previous_solved:
-                # User has solved new problems
-                print(f"User {username} solved {current_solved - previous_solved} new problem(s)")
-                
-                # Update user data
-                user_data['solved_count'] = current_solved
-                user_data['last_solve_date'] = datetime.datetime.now(datetime.UTC).isoformat()
-                
-                # Update streak
-                today = datetime.datetime.now(datetime.UTC).date()
-                last_solve_date = user_data.get('last_solve_date')
-                
-                if last_solve_date:
-                    last_solve = datetime.datetime.fromisoformat(last_solve_date).date()
-                    if last_solve == today - datetime.timedelta(days=1):
-                        # Solved yesterday, streak continues
-                        user_data['streak'] = user_data.get('streak', 0) + 1
-                    elif last_solve == today:
-                        # Already solved today, don't increment streak
-                        pass
-                    else:
-                        # Streak broken, reset to 1
-                        user_data['streak'] = 1
+            current_solved = get_user_solved_count(user_data['leetcode_username'])
+            if current_solved > user_data.get('solved_count', 0):
+                new_counts[user_id] = current_solved
+
+    def record_progress(current_solved):
+        # Runs under the data manager's write lock against the latest record,
+        # so a /mark_solved during the sweep isn't undone
+        def apply(record):
+            if not record or current_solved <= record.get('solved_count', 0):
+                return None
+            print(f"User {record['leetcode_username']} solved {current_solved - record.get('solved_count', 0)} new problem(s)")
+
+            # Update streak, based on the solve date from before this one
+            today = datetime.datetime.now(datetime.UTC).date()
+            last_solve_date = record.get('last_solve_date')
+            streak = record.get('streak', 0)
+
+            if last_solve_date:
+                last_solve = datetime.datetime.fromisoformat(last_solve_date).date()
+                if last_solve == today - datetime.timedelta(days=1):
+                    # Solved yesterday, streak continues
+                    streak += 1
+                elif last_solve == today:
+                    # Already solved today, don't increment streak
+                    pass
                 else:
-                    # First solve
-                    user_data['streak'] = 1
-                
-                data_manager.save_user(user_id, user_data)
-                updated_count += 1
-    
+                    # Streak broken, reset to 1
+                    streak = 1
+            else:
+                # First solve
+                streak = 1
+
+            record['solved_count'] = current_solved
+            record['streak'] = streak
+            record['last_solve_date'] = datetime.datetime.now(datetime.UTC).isoformat()
+            return record
+        return apply
+
+    updated = data_manager.update_users({
+        user_id: record_progress(current_solved) for user_id, current_solved in new_counts.items()
+    }) if new_counts else {}
+
+    updated_count = len(updated)
+    set_span_attributes(updated=updated_count)
     if updated_count > 0:
         print(f"Updated progress for {updated_count} user(s)")
     else:
         print("No user progress updates found")
 
-# Schedule the user progress check every hour
-scheduler.add_job(check_and_update_user_progress, 'interval', hours=1)
-print("Scheduled user progress checks every hour")
+def streak_from_calendar(calendar: dict, today: datetime.date):
+    """Rebuild (streak, last_solve_day) from a {"YYYY-MM-DD": submissions} calendar.
+
+    The streak is the run of consecutive days with submissions ending on the
+    most recent such day, matching how the progress check counts streaks.
+    """
+    days = {datetime.date.fromisoformat(day) for day, count in calendar.items() if count > 0}
+    days = {day for day in days if day <= today}
+    if not days:
+        return 0, None
+    last_day = max(days)
+    streak = 0
+    day = last_day
+    while day in days:
+        streak += 1
+        day -= datetime.timedelta(days=1)
+    return streak, last_day
+
+@traced('job.streak_reconciliation')
+def reconcile_user_streaks():
+    """Rebuild every user's streak and last solve date from their submission calendar"""
+    print("Reconciling user streaks...")
+    users = data_manager.get_all_users()
+    usernames = [u['leetcode_username'] for u in users.values() if u.get('leetcode_username')]
+    set_span_attributes(users=len(usernames))
+    calendars = get_submission_calendars(usernames)
+    today = datetime.datetime.now(datetime.UTC).date()
+
+    def reconcile(username, streak, last_day):
+        # Compared against the latest record under the write lock
+        def apply(record):
+            if not record or record.get('leetcode_username') != username:
+                return None
+
+            # Never move last_solve_date backwards, e.g. past a /mark_solved
+            stored = record.get('last_solve_date')
+            stored_day = datetime.datetime.fromisoformat(stored).date() if stored else None
+            if stored_day and stored_day > last_day:
+                return None
+            if stored_day == last_day:
+                last_solve_date = stored  # keep the more precise timestamp
+            else:
+                last_solve_date = datetime.datetime.combine(last_day, datetime.time(), tzinfo=datetime.UTC).isoformat()
+
+            # The calendar only covers the past year, so don't cut longer streaks short
+            new_streak = max(streak, record.get('streak', 0)) if streak >= 365 else streak
+
+            if new_streak == record.get('streak') and last_solve_date == stored:
+                return None
+            record['streak'] = new_streak
+            record['last_solve_date'] = last_solve_date
+            return record
+        return apply
+
+    updaters = {}
+    for user_id, user_data in users.items():
+        calendar = calendars.get(user_data.get('leetcode_username'))
+        if not calendar:
+            continue
+        streak, last_day = streak_from_calendar(calendar, today)
+        if last_day is not None:
+            updaters[user_id] = reconcile(user_data['leetcode_username'], streak, last_day)
+
+    updated = data_manager.update_users(updaters) if updaters else {}
+    set_span_attributes(updated=len(updated))
+    print(f"Reconciled streaks for {len(updated)} user(s)")
 
-bot.run(TOKEN)
+if __name__ == '__main__':
+    bot.run(TOKEN)
@@ -1,10 +1,101 @@
 import requests
 import json
 import random
+import datetime
+import atexit
+import collections
+import shelve
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional
+from tracing import traced, set_span_attributes
 
 LEETCODE_GRAPHQL_URL = "https://leetcode.com/graphql"
 LEETCODE_API_URL = "https://leetcode.com/api/problems/all/"
 
+# Problem metadata (difficulty, topic tags, acceptance rate) cache
+PROBLEM_CACHE_FILE = 'problem_cache'
+PROBLEM_CACHE_SIZE = 512
+
+_metadata_lock = threading.Lock()
+_metadata_memory = collections.OrderedDict()
+_metadata_disk = None
+
+def _metadata_store():
+    """Open the on-disk metadata cache on first use. Caller must hold _metadata_lock."""
+    global _metadata_disk
+    if _metadata_disk is None:
+        _metadata_disk = shelve.open(PROBLEM_CACHE_FILE)
+    return _metadata_disk
+
+@atexit.register
+def close_problem_cache():
+    """Flush and close the on-disk metadata cache"""
+    global _metadata_disk
+    with _metadata_lock:
+        if _metadata_disk is not None:
+            _metadata_disk.close()
+            _metadata_disk = None
+        _metadata_memory.clear()
+
+def _remember_metadata(slug: str, metadata: Dict):
+    """Put metadata at the front of the in-memory LRU. Caller must hold _metadata_lock."""
+    _metadata_memory[slug] = metadata
+    _metadata_memory.move_to_end(slug)
+    while len(_metadata_memory) > PROBLEM_CACHE_SIZE:
+        _metadata_memory.popitem(last=False)
+
+def cache_problem_metadata(slug: str, **fields):
+    """Merge fields into the cached metadata for a problem and persist it"""
+    with _metadata_lock:
+        store = _metadata_store()
+        metadata = dict(_metadata_memory.get(slug) or store.get(slug) or {'slug': slug})
+        metadata.update({k: v for k, v in fields.items() if v is not None})
+        store[slug] = metadata
+        store.sync()
+        _remember_metadata(slug, metadata)
+
+def cache_catalog_metadata(entries: Dict[str, Dict]):
+    """Merge metadata for many problems into the disk cache with a single sync.
+
+    Used for the full problem catalog, so it only updates the in-memory LRU
+    for problems already in it rather than evicting everything else.
+    """
+    with _metadata_lock:
+        store = _metadata_store()
+        for slug, fields in entries.items():
+            existing = _metadata_memory.get(slug) or store.get(slug) or {'slug': slug}
+            metadata = {**existing, **{k: v for k, v in fields.items() if v is not None}}
+            if metadata == existing:
+                continue
+            store[slug] = metadata
+            if slug in _metadata_memory:
+                _metadata_memory[slug] = metadata
+        store.sync()
+
+def get_cached_problem_metadata(slug: str) -> Optional[Dict]:
+    """Look up problem metadata from memory or disk only, never the network"""
+    if not slug:
+        return None
+    with _metadata_lock:
+        metadata = _metadata_memory.get(slug)
+        if metadata is None:
+            metadata = _metadata_store().get(slug)
+            if metadata is None:
+                return None
+        _remember_metadata(slug, metadata)
+        return dict(metadata)
+
+def _question_metadata(question: Dict) -> Dict:
+    """Pull the fields we cache out of a GraphQL question object"""
+    return {
+        'title': question.get('title'),
+        'difficulty': question.get('difficulty'),
+        'topic_tags': [tag['name'] for tag in question.get('topicTags') or []],
+        'ac_rate': round(question['acRate'], 1) if question.get('acRate') is not None else None
+    }
+
+@traced('leetcode.get_daily_problem')
 def get_daily_problem(difficulty: str = "random"):
     """Get a daily problem, optionally filtered by difficulty"""
     if difficulty == "random":
@@ -17,6 +108,11 @@ def get_daily_problem(difficulty: str = "random"):
               title
               titleSlug
               questionId
+              difficulty
+              acRate
+              topicTags {
+                name
+              }
             }
           }
         }
@@ -27,6 +123,8 @@ def get_daily_problem(difficulty: str = "random"):
                 data = response.json()
                 if 'data' in data and data['data']['activeDailyCodingChallengeQuestion']:
                     question = data['data']['activeDailyCodingChallengeQuestion']['question']
+                    # Comes back in the same request, so cache it for the embeds
+                    cache_problem_metadata(question['titleSlug'], **_question_metadata(question))
                     return {
                         'id': question['questionId'],
                         'title': question['title'],
@@ -44,6 +142,7 @@ def get_daily_problem(difficulty: str = "random"):
     
     return None
 
+@traced('leetcode.get_random_problem_by_difficulty')
 def get_random_problem_by_difficulty(difficulty: str):
     """Get a random problem of specified difficulty using the /api/problems/all/ endpoint"""
     difficulty_map = {
@@ -61,6 +160,22 @@ def get_random_problem_by_difficulty(difficulty: str):
         if response.status_code == 200:
             data = response.json()
             if 'stat_status_pairs' in data:
+                # The catalog lists every problem with its difficulty and acceptance
+                # numbers (but no topic tags), so cache all of it while we have it
+                level_names = {level: name.title() for name, level in difficulty_map.items()}
+                catalog = {}
+                for p in data['stat_status_pairs']:
+                    stat = p['stat']
+                    ac_rate = None
+                    if stat.get('total_submitted'):
+                        ac_rate = round(stat['total_acs'] / stat['total_submitted'] * 100, 1)
+                    catalog[stat['question__title_slug']] = {
+                        'title': stat['question__title'],
+                        'difficulty': level_names.get(p['difficulty']['level']),
+                        'ac_rate': ac_rate
+                    }
+                cache_catalog_metadata(catalog)
+
                 # Filter problems by difficulty
                 target_level = difficulty_map[difficulty]
                 filtered_problems = [
@@ -88,6 +203,30 @@ def get_random_problem_by_difficulty(difficulty: str):
     
     return None
 
+@traced('leetcode.prefetch_problem_metadata')
+def prefetch_problem_metadata(slugs: List[str]):
+    """Fetch and cache metadata for problems in one aliased query.
+
+    Problems that already have topic tags cached are skipped.
+    """
+    slugs = [slug for slug in slugs if 'topic_tags' not in (get_cached_problem_metadata(slug) or {})]
+    slugs = list(dict.fromkeys(slugs))
+    set_span_attributes(slugs=len(slugs))
+    if not slugs:
+        return
+
+    questions = _aliased_query(
+        'question(titleSlug: $var) { title titleSlug difficulty acRate topicTags { name } }',
+        'String!', slugs, 'problem metadata'
+    )
+    if questions is None:
+        return
+    for slug, question in zip(slugs, questions):
+        if question:
+            cache_problem_metadata(slug, **_question_metadata(question))
+        else:
+            print(f"No question data found for slug: {slug}")
+
 def check_user_solved(username, problem_slug):
     # This is a placeholder. In reality, checking if a user solved a specific problem requires more complex API calls or scraping.
     # For now, return False. To implement properly, we might need to use unofficial APIs or web scraping.
@@ -101,6 +240,7 @@ def check_user_solved(username, problem_slug):
 # To properly check, we can use:
 # But for now, placeholder.
 
+@traced('leetcode.get_user_stats')
 def get_user_stats(username):
     query = f"""
     query {{
@@ -129,11 +269,131 @@ def get_user_stats(username):
         print(f"Exception fetching user stats: {e}")
     return None
 
+def _count_solved(stats) -> int:
+    total = 0
+    for item in stats:
+        total += item['count']
+    return total
+
 def get_user_solved_count(username):
     stats = get_user_stats(username)
     if stats:
-        total = 0
-        for item in stats:
-            total += item['count']
-        return total
+        return _count_solved(stats)
     return 0
+
+# How many usernames go into one aliased GraphQL query
+STATS_BATCH_SIZE = 50
+STATS_MAX_WORKERS = 8
+
+@traced('leetcode.get_user_stats_batch')
+def _get_user_stats_batch(usernames: List[str]) -> Optional[Dict[str, Optional[int]]]:
+    """Fetch solved counts for several users in one aliased query.
+
+    Returns None if the request itself failed, otherwise a dict where
+    usernames with no LeetCode account map to None.
+    """
+    set_span_attributes(usernames=len(usernames))
+    users = _aliased_query(
+        'matchedUser(username: $var) { submitStats: submitStatsGlobal { acSubmissionNum { difficulty count } } }',
+        'String!', usernames, 'user stats'
+    )
+    if users is None:
+        return None
+    return {
+        username: _count_solved(user['submitStats']['acSubmissionNum']) if user else None
+        for username, user in zip(usernames, users)
+    }
+
+def get_users_solved_counts(usernames: List[str], batch_size: int = STATS_BATCH_SIZE, max_workers: int = STATS_MAX_WORKERS) -> Dict[str, Optional[int]]:
+    """Get solved counts for many users using batched, concurrent queries.
+
+    Usernames that don't exist map to None. Usernames whose batch failed
+    are left out so callers can tell "not found" from "couldn't check".
+    """
+    return _run_batched(_get_user_stats_batch, usernames, batch_size, max_workers)
+
+def _run_batched(fetch_batch, usernames: List[str], batch_size: int, max_workers: int) -> Dict:
+    """Split usernames into batches, fetch them concurrently and merge the results"""
+    unique = list(dict.fromkeys(usernames))
+    batches = [unique[i:i + batch_size] for i in range(0, len(unique), batch_size)]
+    results = {}
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        for result in executor.map(fetch_batch, batches):
+            if result is not None:
+                results.update(result)
+    return results
+
+def _batch_response_data(payload: Dict, aliases: List[str]) -> Optional[Dict]:
+    """Per-alias data from an aliased query, or None if the request as a whole failed.
+
+    A missing user or problem comes back as a null alias with an error whose
+    path points at it. An error without a path and nothing for any alias,
+    or no data at all, means the query itself failed.
+    """
+    data = payload.get('data')
+    if not isinstance(data, dict) or not any(alias in data for alias in aliases):
+        return None
+    errors = payload.get('errors') or []
+    request_errors = [error for error in errors if not error.get('path')]
+    if request_errors and all(data.get(alias) is None for alias in aliases):
+        return None
+    return data
+
+def _aliased_query(field: str, variable_type: str, values: List[str], description: str) -> Optional[List[Optional[Dict]]]:
+    """Run ``field`` once per value in a single GraphQL request, aliased v0, v1, ...
+
+    ``field`` uses ``$var`` where the value goes. Returns the per-value
+    results in order (None where nothing was found), or None if the
+    request failed.
+    """
+    aliases = [f'v{i}' for i in range(len(values))]
+    variables = dict(zip(aliases, values))
+    params = ', '.join(f'${alias}: {variable_type}' for alias in aliases)
+    fields = '\n'.join(f"{alias}: {field.replace('$var', '$' + alias)}" for alias in aliases)
+    query = f"query({params}) {{\n{fields}\n}}"
+    try:
+        response = requests.post(LEETCODE_GRAPHQL_URL, json={'query': query, 'variables': variables}, timeout=30)
+        if response.status_code == 200:
+            data = _batch_response_data(response.json(), aliases)
+            if data is not None:
+                return [data.get(alias) for alias in aliases]
+            print(f"Error fetching {description}: {response.text}")
+        else:
+            print(f"Error fetching {description}: {response.status_code} - {response.text}")
+    except Exception as e:
+        print(f"Exception fetching {description}: {e}")
+    return None
+
+def _parse_submission_calendar(raw: str) -> Dict[str, int]:
+    """Turn LeetCode's {"<unix ts>": count} JSON string into {"YYYY-MM-DD": count} (UTC)"""
+    calendar = {}
+    for timestamp, count in json.loads(raw or '{}').items():
+        day = datetime.datetime.fromtimestamp(int(timestamp), datetime.UTC).date().isoformat()
+        calendar[day] = calendar.get(day, 0) + int(count)
+    return calendar
+
+@traced('leetcode.get_submission_calendars_batch')
+def _get_submission_calendars_batch(usernames: List[str]) -> Optional[Dict[str, Optional[Dict[str, int]]]]:
+    """Fetch the past year's daily submission counts for several users in one query"""
+    set_span_attributes(usernames=len(usernames))
+    users = _aliased_query(
+        'matchedUser(username: $var) { userCalendar { submissionCalendar } }',
+        'String!', usernames, 'submission calendars'
+    )
+    if users is None:
+        return None
+    calendars = {}
+    for username, user in zip(usernames, users):
+        if user and user.get('userCalendar'):
+            calendars[username] = _parse_submission_calendar(user['userCalendar']['submissionCalendar'])
+        else:
+            calendars[username] = None
+    return calendars
+
+def get_submission_calendars(usernames: List[str], batch_size: int = STATS_BATCH_SIZE, max_workers: int = STATS_MAX_WORKERS) -> Dict[str, Optional[Dict[str, int]]]:
+    """Get {"YYYY-MM-DD": submissions} calendars for many users.
+
+    Same conventions as get_users_solved_counts: unknown users map to None,
+    users whose batch failed are left out.
+    """
+    return _run_batched(_get_submission_calendars_batch, usernames, batch_size, max_workers)
@@ -1,85 +1,313 @@
+import copy
 import json
 import os
 import datetime
-from typing import Dict, List, Optional
+import gzip
+import threading
+from typing import Callable, Dict, List, Optional
+from tracing import traced
 
 DATA_FILE = 'bot_data.json'
 
+# Days of daily_problems/user_solves history kept in the data file; older
+# entries are moved to gzipped segments in the archive directory.
+# Override with RETENTION_DAYS in the environment.
+DEFAULT_RETENTION_DAYS = 90
+
+def _empty_data() -> Dict:
+    return {
+        'users': {},
+        'daily_problems': {},
+        'configs': {},
+        'user_solves': [],
+        'archive_segments': []
+    }
+
 class DataManager:
-    def __init__(self):
-        self.data = {
-            'users': {},
-            'daily_problems': {},
-            'configs': {},
-            'user_solves': []
-        }
+    """JSON-backed store with copy-on-write snapshots.
+
+    Readers grab the currently published snapshot without locking and get
+    copies of the records they ask for, so they never see a half-applied
+    write. All writers go through ``_write_lock``: they build a new snapshot
+    from the old one and publish it with a single attribute assignment.
+    Read-modify-write of user records goes through ``update_users`` so the
+    change is computed from the latest record while the lock is held.
+
+    Persisting happens after the lock is released and is serialized by
+    ``_save_lock``. A writer that finds another thread mid-save returns
+    right away and that thread writes the newer snapshot on its next pass,
+    so the event loop only ever waits on disk for its own save. The cost is
+    that a write may reach the file shortly after the call returns.
+    Safe to call from the event loop and from worker threads.
+    """
+
+    def __init__(self, data_file: str = DATA_FILE, archive_dir: Optional[str] = None, retention_days: Optional[int] = None):
+        self.data_file = data_file
+        self.archive_dir = archive_dir or os.path.join(os.path.dirname(data_file), 'archive')
+        # Read here rather than at import so a value loaded from .env applies
+        if retention_days is None:
+            retention_days = int(os.getenv('RETENTION_DAYS', DEFAULT_RETENTION_DAYS))
+        self.retention_days = retention_days
+        self._write_lock = threading.RLock()
+        self._save_lock = threading.Lock()
+        self._compact_lock = threading.Lock()
+        self._snapshot = _empty_data()
+        self.version = 0
+        self._saved_version = 0
         self.load_data()
 
+    @traced('datastore.load_data')
     def load_data(self):
         """Load data from JSON file"""
-        if os.path.exists(DATA_FILE):
+        if os.path.exists(self.data_file):
             try:
-                with open(DATA_FILE, 'r') as f:
-                    self.data = json.load(f)
+                with open(self.data_file, 'r') as f:
+                    loaded = json.load(f)
             except (json.JSONDecodeError, FileNotFoundError):
                 print("Warning: Could not load data file, starting with empty data")
-                self.data = {
-                    'users': {},
-                    'daily_problems': {},
-                    'configs': {},
-                    'user_solves': []
-                }
+                loaded = _empty_data()
+            loaded.setdefault('user_solves', [])
+            loaded.setdefault('archive_segments', [])
+            with self._write_lock:
+                self._publish(loaded)
+                self._saved_version = self.version
 
-    def save_data(self):
-        """Save data to JSON file"""
-        try:
-            with open(DATA_FILE, 'w') as f:
-                json.dump(self.data, f, indent=2, default=str)
-        except Exception as e:
-            print(f"Error saving data: {e}")
+    @traced('datastore.save_data')
+    def save_data(self, wait: bool = False):
+        """Save the latest snapshot to the JSON file.
 
+        Returns immediately if another thread is already saving (it will
+        pick up this snapshot) unless ``wait`` is set.
+        """
+        while self._saved_version < self.version:
+            if not self._save_lock.acquire(blocking=wait):
+                return
+            try:
+                while self._saved_version < self.version:
+                    with self._write_lock:
+                        snapshot, version = self._snapshot, self.version
+                    tmp_file = f'{self.data_file}.tmp'
+                    try:
+                        with open(tmp_file, 'w') as f:
+                            json.dump(snapshot, f, indent=2, default=str)
+                        os.replace(tmp_file, self.data_file)
+                    except Exception as e:
+                        print(f"Error saving data: {e}")
+                        return
+                    self._saved_version = version
+            finally:
+                self._save_lock.release()
+
+    def _publish(self, new_data: Dict):
+        """Swap in a new snapshot. Caller must hold the write lock."""
+        self._snapshot = new_data
+        self.version += 1
+
+    def _write(self, section: str, key: str, value: Dict):
+        """Copy-on-write update of a single record, then persist"""
+        with self._write_lock:
+            new_data = dict(self._snapshot)
+            new_section = dict(new_data[section])
+            new_section[key] = copy.deepcopy(value)
+            new_data[section] = new_section
+            self._publish(new_data)
+        self.save_data()
+
+    @traced('datastore.get_user')
     def get_user(self, discord_id: str) -> Optional[Dict]:
         """Get user by Discord ID"""
-        return self.data['users'].get(discord_id)
+        user = self._snapshot['users'].get(discord_id)
+        return copy.deepcopy(user) if user is not None else None
 
+    @traced('datastore.save_user')
     def save_user(self, discord_id: str, user_data: Dict):
         """Save or update user"""
-        self.data['users'][discord_id] = user_data
-        self.save_data()
+        self._write('users', discord_id, user_data)
+
+    @traced('datastore.update_users')
+    def update_users(self, updaters: Dict[str, Callable[[Optional[Dict]], Optional[Dict]]]) -> Dict[str, Dict]:
+        """Read-modify-write several users in a single write.
+
+        Each updater gets a copy of the user's current record (None if there
+        is none) and returns the record to store, or None to leave it alone.
+        Updaters run with the write lock held, so they must not do I/O.
+        Returns the records that were written.
+        """
+        with self._write_lock:
+            users = self._snapshot['users']
+            written = {}
+            for discord_id, updater in updaters.items():
+                current = users.get(discord_id)
+                updated = updater(copy.deepcopy(current) if current is not None else None)
+                if updated is not None:
+                    written[discord_id] = copy.deepcopy(updated)
+            if written:
+                new_data = dict(self._snapshot)
+                new_data['users'] = {**users, **written}
+                self._publish(new_data)
+        if written:
+            self.save_data()
+        return copy.deepcopy(written)
+
+    def update_user(self, discord_id: str, updater: Callable[[Optional[Dict]], Optional[Dict]]) -> Optional[Dict]:
+        """Read-modify-write one user; see update_users"""
+        return self.update_users({discord_id: updater}).get(discord_id)
 
+    @traced('datastore.save_users')
+    def save_users(self, users: Dict[str, Dict]):
+        """Save or update many users in a single write"""
+        self.update_users({discord_id: (lambda _, user=user: user) for discord_id, user in users.items()})
+
+    @traced('datastore.get_config')
     def get_config(self, guild_id: str) -> Optional[Dict]:
         """Get config by guild ID"""
-        return self.data['configs'].get(guild_id)
+        config = self._snapshot['configs'].get(guild_id)
+        return copy.deepcopy(config) if config is not None else None
 
+    @traced('datastore.save_config')
     def save_config(self, guild_id: str, config_data: Dict):
         """Save or update config"""
-        self.data['configs'][guild_id] = config_data
-        self.save_data()
+        self._write('configs', guild_id, config_data)
 
+    @traced('datastore.get_daily_problem')
     def get_daily_problem(self, date: str) -> Optional[Dict]:
-        """Get daily problem by date"""
-        return self.data['daily_problems'].get(date)
+        """Get daily problem by date, checking the archive for dates older than the live window"""
+        snapshot = self._snapshot
+        problem = snapshot['daily_problems'].get(date)
+        if problem is not None:
+            return copy.deepcopy(problem)
+        archived = self._read_archive(snapshot, 'daily_problems', date, date)
+        return archived[-1]['value'] if archived else None
+
+    @traced('datastore.get_daily_problems')
+    def get_daily_problems(self, start_date: str, end_date: str) -> Dict[str, Dict]:
+        """Get daily problems between two ISO dates (inclusive)"""
+        snapshot = self._snapshot
+        problems = {}
+        for entry in self._read_archive(snapshot, 'daily_problems', start_date, end_date):
+            problems[entry['key']] = entry['value']
+        for date, problem in snapshot['daily_problems'].items():
+            if start_date <= date <= end_date:
+                problems[date] = copy.deepcopy(problem)
+        return dict(sorted(problems.items()))
+
+    @traced('datastore.get_user_solves')
+    def get_user_solves(self, start_date: str, end_date: str) -> List[Dict]:
+        """Get user_solves entries dated between two ISO dates (inclusive)"""
+        snapshot = self._snapshot
+        solves = [entry['value'] for entry in self._read_archive(snapshot, 'user_solves', start_date, end_date)]
+        for solve in snapshot['user_solves']:
+            if start_date <= _entry_date(solve) <= end_date:
+                solves.append(copy.deepcopy(solve))
+        return solves
+
+    def _read_archive(self, snapshot: Dict, kind: str, start_date: str, end_date: str) -> List[Dict]:
+        """Read archived entries in a date range from the segments listed in ``snapshot``.
+
+        Callers pass the same snapshot they read live entries from, so an
+        entry is found in exactly one of the two even if compact() runs.
+        """
+        entries = []
+        for segment in snapshot['archive_segments']:
+            if segment['last_date'] < start_date or segment['first_date'] > end_date:
+                continue
+            path = os.path.join(self.archive_dir, segment['file'])
+            try:
+                with gzip.open(path, 'rt') as f:
+                    for line in f:
+                        entry = json.loads(line)
+                        if entry['kind'] == kind and start_date <= entry['date'] <= end_date:
+                            entries.append(entry)
+            except (OSError, json.JSONDecodeError) as e:
+                print(f"Error reading archive segment {segment['file']}: {e}")
+        return entries
+
+    @traced('datastore.compact')
+    def compact(self, today: Optional[datetime.date] = None) -> Dict:
+        """Move history older than the retention window into a new archive segment.
+
+        Segments are gzipped JSON lines and are never modified once written.
+        Afterwards the data file holds at most ``retention_days`` worth of
+        daily problems and solves (today included); the returned stats
+        include its size. The segment is written without holding the write
+        lock, then exactly the archived entries are dropped from whatever
+        snapshot is current at that point.
+        """
+        today = today or datetime.datetime.now(datetime.UTC).date()
+        cutoff = (today - datetime.timedelta(days=self.retention_days - 1)).isoformat()
+        with self._compact_lock:
+            with self._write_lock:
+                snapshot, version = self._snapshot, self.version
+            old_problems = {d: p for d, p in snapshot['daily_problems'].items() if d < cutoff}
+            old_solves = [s for s in snapshot['user_solves'] if _entry_date(s) and _entry_date(s) < cutoff]
 
+            if old_problems or old_solves:
+                entries = [{'kind': 'daily_problems', 'date': d, 'key': d, 'value': p} for d, p in sorted(old_problems.items())]
+                entries += [{'kind': 'user_solves', 'date': _entry_date(s), 'value': s} for s in old_solves]
+                dates = [entry['date'] for entry in entries]
+                segment = {
+                    'file': f"segment_{datetime.datetime.now(datetime.UTC).strftime('%Y%m%dT%H%M%S')}_{version}.jsonl.gz",
+                    'first_date': min(dates),
+                    'last_date': max(dates),
+                    'entries': len(entries)
+                }
+                # Write the segment before dropping anything from the data file
+                os.makedirs(self.archive_dir, exist_ok=True)
+                path = os.path.join(self.archive_dir, segment['file'])
+                with gzip.open(f'{path}.tmp', 'wt') as f:
+                    for entry in entries:
+                        f.write(json.dumps(entry, default=str) + '\n')
+                os.replace(f'{path}.tmp', path)
+
+                # Records are replaced, never mutated, so identity tells us
+                # whether an entry is still the one that was archived
+                archived_solves = {id(s) for s in old_solves}
+                with self._write_lock:
+                    current = self._snapshot
+                    new_data = dict(current)
+                    new_data['daily_problems'] = {
+                        d: p for d, p in current['daily_problems'].items() if old_problems.get(d) is not p
+                    }
+                    new_data['user_solves'] = [s for s in current['user_solves'] if id(s) not in archived_solves]
+                    new_data['archive_segments'] = current['archive_segments'] + [segment]
+                    self._publish(new_data)
+
+            live = self._snapshot
+            stats = {
+                'archived_problems': len(old_problems),
+                'archived_solves': len(old_solves),
+                'live_problems': len(live['daily_problems']),
+                'live_solves': len(live['user_solves']),
+            }
+        self.save_data(wait=True)
+        stats['data_file_bytes'] = os.path.getsize(self.data_file) if os.path.exists(self.data_file) else 0
+        print(f"Compaction archived {stats['archived_problems']} problem(s) and {stats['archived_solves']} solve(s); "
+              f"data file is {stats['data_file_bytes']} bytes")
+        return stats
+
+    @traced('datastore.save_daily_problem')
     def save_daily_problem(self, date: str, problem_data: Dict):
         """Save daily problem"""
-        self.data['daily_problems'][date] = problem_data
-        self.save_data()
+        self._write('daily_problems', date, problem_data)
 
+    @traced('datastore.get_all_configs')
     def get_all_configs(self) -> List[Dict]:
         """Get all configs"""
-        return list(self.data['configs'].values())
+        return copy.deepcopy(list(self._snapshot['configs'].values()))
 
+    @traced('datastore.get_top_users_by_streak')
     def get_top_users_by_streak(self, limit: int = 10) -> List[Dict]:
         """Get top users by streak"""
-        users = list(self.data['users'].values())
+        users = list(self._snapshot['users'].values())
         users.sort(key=lambda x: x.get('streak', 0), reverse=True)
-        return users[:limit]
+        return copy.deepcopy(users[:limit])
 
+    @traced('datastore.get_today_solvers')
     def get_today_solvers(self) -> List[Dict]:
         """Get users who have solved today's problem"""
         today = datetime.datetime.now(datetime.UTC).date().isoformat()
         solvers = []
-        for user_id, user_data in self.data['users'].items():
+        for user_id, user_data in self._snapshot['users'].items():
             last_solve = user_data.get('last_solve_date')
             if last_solve:
                 solve_date = datetime.datetime.fromisoformat(last_solve).date().isoformat()
@@ -91,11 +319,12 @@ class DataManager:
                     })
         return solvers
 
+    @traced('datastore.get_active_streaks')
     def get_active_streaks(self) -> List[Dict]:
         """Get users with active streaks (solved within last 7 days)"""
         week_ago = datetime.datetime.now(datetime.UTC) - datetime.timedelta(days=7)
         active_users = []
-        for user_id, user_data in self.data['users'].items():
+        for user_id, user_data in self._snapshot['users'].items():
             last_solve = user_data.get('last_solve_date')
             if last_solve:
                 solve_date = datetime.datetime.fromisoformat(last_solve)
@@ -108,11 +337,12 @@ class DataManager:
                     })
         return active_users
 
+    @traced('datastore.get_yesterday_solvers')
     def get_yesterday_solvers(self) -> List[str]:
         """Get Discord user IDs of users who solved yesterday's problem"""
         yesterday = (datetime.datetime.now(datetime.UTC) - datetime.timedelta(days=1)).date().isoformat()
         yesterday_solvers = []
-        for user_id, user_data in self.data['users'].items():
+        for user_id, user_data in self._snapshot['users'].items():
             last_solve = user_data.get('last_solve_date')
             if last_solve:
                 solve_date = datetime.datetime.fromisoformat(last_solve).date().isoformat()
@@ -120,9 +350,28 @@ class DataManager:
                     yesterday_solvers.append(user_id)
         return yesterday_solvers
 
+    @traced('datastore.get_all_users')
     def get_all_users(self) -> Dict[str, Dict]:
         """Get all users"""
-        return self.data['users']
+        return copy.deepcopy(self._snapshot['users'])
+
+    @traced('datastore.get_linked_usernames')
+    def get_linked_usernames(self) -> Dict[str, str]:
+        """Map lowercased LeetCode usernames to the Discord ID they are linked to"""
+        return {
+            user['leetcode_username'].lower(): discord_id
+            for discord_id, user in self._snapshot['users'].items()
+            if user.get('leetcode_username')
+        }
+
+    @traced('datastore.get_user_count')
+    def get_user_count(self) -> int:
+        """Get number of registered users"""
+        return len(self._snapshot['users'])
+
+def _entry_date(entry: Dict) -> str:
+    """ISO date (YYYY-MM-DD) an entry belongs to, or '' if it has none"""
+    return str(entry.get('date') or '')[:10]
 
 # Global data manager instance
 data_manager = DataManager()
@@ -148,9 +397,10 @@ def create_config(guild_id: str, channel_id: str, post_hour: int = 9, post_minut
     }
 
 # Daily problem data structure
-def create_daily_problem(problem_id: str, title: str) -> Dict:
+def create_daily_problem(problem_id: str, title: str, slug: Optional[str] = None) -> Dict:
     return {
         'problem_id': problem_id,
         'title': title,
+        'slug': slug,
         'date': datetime.datetime.now(datetime.UTC).isoformat()
     }
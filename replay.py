@@ -0,0 +1,272 @@
+"""Offline replay harness for the slash-command handlers.
+
+Builds fake Discord interaction/guild/channel/user objects, points bot.py at
+a throwaway DataManager and replays recorded or synthetic command traffic
+at a fixed rate against the real handlers. LeetCode calls are replaced with
+fakes that block for ``--api-latency-ms`` like the real ``requests`` calls do.
+
+Usage:
+    python replay.py --rate 200 --duration 10 --users 1000
+    python replay.py --trace traffic.jsonl --rate 50
+
+A trace file has one JSON object per line:
+    {"command": "status", "user_id": "42", "args": {}, "admin": false}
+"""
+import argparse
+import datetime
+import asyncio
+import json
+import os
+import random
+import tempfile
+import time
+from typing import Dict, List, Optional
+
+import bot as bot_module
+import leetcode
+from models import DataManager, create_user, create_config, create_daily_problem
+
+COMMANDS = {
+    'status': bot_module.status,
+    'mark_solved': bot_module.mark_solved,
+    'leaderboard': bot_module.leaderboard,
+    'today_solvers': bot_module.today_solvers,
+    'post_now': bot_module.post_now,
+    'setup_username': bot_module.setup_username,
+}
+
+# Default synthetic mix, roughly what a busy server sees
+DEFAULT_MIX = {
+    'status': 40,
+    'mark_solved': 15,
+    'leaderboard': 20,
+    'today_solvers': 20,
+    'setup_username': 4,
+    'post_now': 1,
+}
+
+GUILD_ID = 1000
+CHANNEL_ID = 2000
+
+class FakePermissions:
+    def __init__(self, administrator: bool = False):
+        self.administrator = administrator
+
+class FakeUser:
+    def __init__(self, user_id: int, administrator: bool = False):
+        self.id = user_id
+        self.name = f"user{user_id}"
+        self.guild_permissions = FakePermissions(administrator)
+
+    @property
+    def mention(self) -> str:
+        return f"<@{self.id}>"
+
+class FakeGuild:
+    def __init__(self, guild_id: int):
+        self.id = guild_id
+
+class FakeChannel:
+    def __init__(self, channel_id: int):
+        self.id = channel_id
+        self.sent = 0
+
+    @property
+    def mention(self) -> str:
+        return f"<#{self.id}>"
+
+    async def send(self, content=None, **kwargs):
+        self.sent += 1
+
+class FakeResponse:
+    def __init__(self):
+        self.messages = []
+        self._done = False
+
+    def is_done(self) -> bool:
+        return self._done
+
+    async def send_message(self, content=None, **kwargs):
+        if self._done:
+            raise RuntimeError("Interaction has already been responded to")
+        self._done = True
+        self.messages.append(content)
+
+    async def defer(self, **kwargs):
+        if self._done:
+            raise RuntimeError("Interaction has already been responded to")
+        self._done = True
+
+class FakeFollowup:
+    def __init__(self):
+        self.messages = []
+
+    async def send(self, content=None, **kwargs):
+        self.messages.append(content)
+
+class FakeInteraction:
+    def __init__(self, user: FakeUser, guild: FakeGuild, command_name: str):
+        self.user = user
+        self.guild = guild
+        self.command_name = command_name
+        self.response = FakeResponse()
+        self.followup = FakeFollowup()
+
+def install_fakes(data_file: str, api_latency_ms: float) -> FakeChannel:
+    """Point bot.py at a fresh DataManager and fake LeetCode/Discord lookups"""
+    channel = FakeChannel(CHANNEL_ID)
+    bot_module.data_manager = DataManager(data_file)
+    leetcode.PROBLEM_CACHE_FILE = os.path.join(os.path.dirname(data_file), 'problem_cache')
+    leetcode.cache_problem_metadata('two-sum', title='Two Sum', difficulty='Easy', ac_rate=55.2, topic_tags=['Array', 'Hash Table'])
+    bot_module.bot.get_channel = lambda channel_id: channel if channel_id == CHANNEL_ID else None
+
+    def fake_solved_count(username):
+        time.sleep(api_latency_ms / 1000)
+        return random.randint(0, 500)
+
+    def fake_daily_problem(difficulty="random"):
+        time.sleep(api_latency_ms / 1000)
+        return {'id': '1', 'title': 'Two Sum', 'slug': 'two-sum'}
+
+    def fake_prefetch(slugs):
+        time.sleep(api_latency_ms / 1000)
+
+    bot_module.get_user_solved_count = fake_solved_count
+    bot_module.get_daily_problem = fake_daily_problem
+    bot_module.prefetch_problem_metadata = fake_prefetch
+    return channel
+
+def seed_store(user_count: int, with_problem: bool = True):
+    """Fill the store with users, a guild config and (optionally) today's problem"""
+    store = bot_module.data_manager
+    store.save_config(str(GUILD_ID), create_config(str(GUILD_ID), str(CHANNEL_ID)))
+    store.save_users({
+        str(user_id): create_user(str(user_id), f"user{user_id}", random.randint(0, 500))
+        for user_id in range(1, user_count + 1)
+    })
+    if with_problem:
+        today = datetime.datetime.now(datetime.UTC).date().isoformat()
+        store.save_daily_problem(today, create_daily_problem('1', 'Two Sum', 'two-sum'))
+
+def synthetic_traffic(count: int, user_count: int, mix: Dict[str, int]) -> List[Dict]:
+    """Generate ``count`` random command events using the weighted ``mix``"""
+    names = list(mix)
+    weights = [mix[name] for name in names]
+    events = []
+    for command in random.choices(names, weights=weights, k=count):
+        user_id = random.randint(1, user_count)
+        event = {'command': command, 'user_id': str(user_id), 'args': {}, 'admin': command == 'post_now'}
+        if command == 'setup_username':
+            event['args'] = {'username': f"user{user_id}"}
+        events.append(event)
+    return events
+
+def load_trace(path: str) -> List[Dict]:
+    """Load recorded command events from a JSONL file"""
+    events = []
+    with open(path, 'r') as f:
+        for line in f:
+            line = line.strip()
+            if line:
+                events.append(json.loads(line))
+    return events
+
+def percentile(values: List[float], pct: float) -> float:
+    """Nearest-rank percentile"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = max(0, min(len(ordered) - 1, int(round(pct / 100 * len(ordered))) - 1))
+    return ordered[index]
+
+async def monitor_loop_lag(stop: asyncio.Event, lags: List[float], interval: float = 0.01):
+    """Record how late the event loop wakes us up; large values mean a stall"""
+    loop = asyncio.get_running_loop()
+    while not stop.is_set():
+        expected = loop.time() + interval
+        await asyncio.sleep(interval)
+        lags.append(max(0.0, loop.time() - expected) * 1000)
+
+async def run_event(event: Dict, scheduled_at: float, results: Dict[str, Dict]):
+    command_name = event['command']
+    stats = results.setdefault(command_name, {'latencies': [], 'errors': 0})
+    command = COMMANDS.get(command_name)
+    if command is None:
+        stats['errors'] += 1
+        return
+
+    user = FakeUser(int(event['user_id']), administrator=event.get('admin', False))
+    interaction = FakeInteraction(user, FakeGuild(int(event.get('guild_id', GUILD_ID))), command_name)
+    try:
+        await command.callback(interaction, **event.get('args', {}))
+    except Exception as e:
+        stats['errors'] += 1
+        print(f"Error in {command_name}: {e}")
+    # Measured from the scheduled start so queueing behind a stalled loop counts
+    stats['latencies'].append((time.perf_counter() - scheduled_at) * 1000)
+
+async def replay(events: List[Dict], rate: float) -> Dict:
+    """Fire ``events`` at ``rate`` per second and wait for all of them to finish"""
+    results = {}
+    lags = []
+    stop = asyncio.Event()
+    monitor = asyncio.create_task(monitor_loop_lag(stop, lags))
+
+    tasks = []
+    start = time.perf_counter()
+    for i, event in enumerate(events):
+        scheduled_at = start + i / rate
+        delay = scheduled_at - time.perf_counter()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        tasks.append(asyncio.create_task(run_event(event, scheduled_at, results)))
+    await asyncio.gather(*tasks)
+    elapsed = time.perf_counter() - start
+
+    stop.set()
+    await monitor
+    return {'commands': results, 'elapsed': elapsed, 'loop_lag_ms': lags}
+
+def print_report(report: Dict):
+    elapsed = report['elapsed']
+    total = sum(len(stats['latencies']) for stats in report['commands'].values())
+    print(f"\nReplayed {total} interactions in {elapsed:.2f}s ({total / elapsed:.1f}/s)\n")
+    print(f"{'command':<16}{'count':>8}{'errors':>8}{'rps':>10}{'p50 ms':>10}{'p99 ms':>10}{'max ms':>10}")
+    for name, stats in sorted(report['commands'].items()):
+        latencies = stats['latencies']
+        print(
+            f"{name:<16}{len(latencies):>8}{stats['errors']:>8}{len(latencies) / elapsed:>10.1f}"
+            f"{percentile(latencies, 50):>10.1f}{percentile(latencies, 99):>10.1f}{max(latencies, default=0):>10.1f}"
+        )
+    lags = report['loop_lag_ms']
+    print(f"\nEvent loop lag: p50 {percentile(lags, 50):.1f} ms, p99 {percentile(lags, 99):.1f} ms, max {max(lags, default=0):.1f} ms")
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description="Replay slash-command traffic against the real handlers")
+    parser.add_argument('--trace', help="JSONL file of recorded command events (default: synthetic traffic)")
+    parser.add_argument('--rate', type=float, default=100, help="Target interactions per second")
+    parser.add_argument('--duration', type=float, default=10, help="Seconds of synthetic traffic to generate")
+    parser.add_argument('--users', type=int, default=500, help="Number of registered users to seed")
+    parser.add_argument('--api-latency-ms', type=float, default=0, help="Simulated blocking LeetCode API latency")
+    parser.add_argument('--no-problem', action='store_true', help="Don't seed today's problem")
+    parser.add_argument('--seed', type=int, help="Random seed for reproducible runs")
+    args = parser.parse_args(argv)
+
+    if args.seed is not None:
+        random.seed(args.seed)
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        install_fakes(os.path.join(tmp_dir, 'bot_data.json'), args.api_latency_ms)
+        seed_store(args.users, with_problem=not args.no_problem)
+
+        if args.trace:
+            events = load_trace(args.trace)
+        else:
+            events = synthetic_traffic(int(args.rate * args.duration), args.users, DEFAULT_MIX)
+
+        report = asyncio.run(replay(events, args.rate))
+        leetcode.close_problem_cache()
+    print_report(report)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,147 @@
+import collections
+import contextlib
+import contextvars
+import datetime
+import functools
+import inspect
+import json
+import os
+import sys
+import threading
+import time
+from typing import Dict, Optional
+
+# Spans slower than this many ms (TRACE_SLOW_MS) are written to the structured log
+DEFAULT_SLOW_SPAN_MS = 250
+
+_current_span = contextvars.ContextVar('current_span', default=None)
+
+def slow_span_ms() -> float:
+    """Read at call time so values loaded from .env after import still apply"""
+    return float(os.getenv('TRACE_SLOW_MS', DEFAULT_SLOW_SPAN_MS))
+
+def set_span_attributes(**attributes):
+    """Add attributes to the innermost active span, if any"""
+    current = _current_span.get()
+    if current is not None:
+        current[1].update(attributes)
+
+@contextlib.contextmanager
+def span(name: str, **attributes):
+    """Time a block of code. Yields the attribute dict so callers can add to it."""
+    current = _current_span.get()
+    parent = current[0] if current else None
+    token = _current_span.set((name, attributes))
+    start = time.perf_counter()
+    error = None
+    try:
+        yield attributes
+    except BaseException as e:
+        error = type(e).__name__
+        raise
+    finally:
+        duration_ms = (time.perf_counter() - start) * 1000
+        _current_span.reset(token)
+        if duration_ms >= slow_span_ms():
+            log_slow_span(name, duration_ms, attributes, parent, error)
+
+def log_slow_span(name: str, duration_ms: float, attributes: Dict, parent: Optional[str] = None, error: Optional[str] = None):
+    """Write a slow span as one JSON line"""
+    record = {
+        'event': 'slow_span',
+        'span': name,
+        'duration_ms': round(duration_ms, 2),
+        'parent': parent,
+        'error': error,
+        'attributes': attributes,
+        'time': datetime.datetime.now(datetime.UTC).isoformat()
+    }
+    print(json.dumps(record, default=str))
+
+def _interaction_attributes(args) -> Dict:
+    """Pull guild/user ids out of a discord.Interaction if one is passed"""
+    interaction = args[0] if args else None
+    guild = getattr(interaction, 'guild', None)
+    user = getattr(interaction, 'user', None)
+    attributes = {}
+    if guild is not None:
+        attributes['guild'] = str(guild.id)
+    if user is not None:
+        attributes['user'] = str(user.id)
+    return attributes
+
+def traced(name: str, **attributes):
+    """Decorator that wraps a sync or async function in a span"""
+    def decorator(func):
+        if inspect.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                with span(name, **attributes, **_interaction_attributes(args)):
+                    return await func(*args, **kwargs)
+            return async_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with span(name, **attributes):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+class SamplingProfiler:
+    """Samples the stacks of all threads and aggregates them in folded format.
+
+    The output of ``dump()`` is one ``frame;frame;frame count`` line per
+    unique stack, which flamegraph.pl and speedscope read directly.
+    """
+
+    def __init__(self, interval: float = 0.005):
+        self.interval = interval
+        self.samples = collections.Counter()
+        self.sample_count = 0
+        self._stop = threading.Event()
+        self._thread = None
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self):
+        if self.running:
+            raise RuntimeError("Profiler is already running")
+        self.samples.clear()
+        self.sample_count = 0
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name='sampling-profiler', daemon=True)
+        self._thread.start()
+
+    def stop(self) -> str:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        return self.dump()
+
+    def _run(self):
+        own_id = threading.get_ident()
+        thread_names = {}
+        while not self._stop.wait(self.interval):
+            for thread in threading.enumerate():
+                thread_names[thread.ident] = thread.name
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own_id:
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                    frame = frame.f_back
+                stack.append(thread_names.get(thread_id, str(thread_id)))
+                stack.reverse()
+                self.samples[';'.join(stack)] += 1
+            self.sample_count += 1
+
+    def dump(self) -> str:
+        lines = [f"{stack} {count}" for stack, count in self.samples.most_common()]
+        return '\n'.join(lines) + '\n' if lines else ''
+
+profiler = SamplingProfiler()